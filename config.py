@@ -0,0 +1,14 @@
+from functools import lru_cache
+from dotenv import load_dotenv
+
+
+@lru_cache(maxsize=1)
+def ensure_env() -> None:
+    """
+    Load .env into the environment, once per process.
+
+    Modules call this right before they first read their settings, instead of
+    each running load_dotenv() at import. Variables already present in the
+    environment take precedence over the .env file.
+    """
+    load_dotenv()
@@ -0,0 +1,388 @@
+from google import genai
+from google.genai import types
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
+from cachetools import TTLCache
+from patch_utils import split_patch, compact_patch
+import redis
+import redis.asyncio as aioredis
+import asyncio
+import hashlib
+import orjson
+import os
+import re
+import threading
+
+MODEL_NAME = "models/gemini-1.5-flash"
+
+GENERATION_CONFIG = types.GenerateContentConfig(
+    temperature=0.1,
+    response_mime_type="application/json"
+)
+
+
+@lru_cache(maxsize=None)
+def get_client(api_key: str) -> genai.Client:
+    """
+    Return the shared genai.Client for an API key, so agents on one key reuse one client.
+    Agents call this when a review runs rather than at import, so the client is
+    only constructed by processes that actually talk to Gemini.
+    """
+    return genai.Client(api_key=api_key)
+
+
+@lru_cache(maxsize=None)
+def get_semaphore(api_key: str) -> asyncio.Semaphore:
+    """Return the concurrency gate for an API key, shared by every agent using that key."""
+    return asyncio.Semaphore(int(os.getenv("GEMINI_CONCURRENCY", "6")))
+
+
+@lru_cache(maxsize=1)
+def _stream_executor() -> ThreadPoolExecutor:
+    """
+    Threads that consume Gemini response streams. Kept apart from asyncio's
+    default executor (min(32, cpus + 4) threads, shared with to_thread), which
+    would otherwise cap how many streams run at once below the per-key
+    semaphores on small machines.
+    """
+    return ThreadPoolExecutor(max_workers=int(os.getenv("GEMINI_STREAM_THREADS", "32")),
+                              thread_name_prefix="gemini-stream")
+
+
+# Gemini results are cached in Redis (when REDIS_URL is set) by a hash of the
+# full prompt, so identical patches across PRs, reopened PRs and retries skip
+# the LLM call. Bump CACHE_VERSION to invalidate entries after model changes.
+CACHE_VERSION = "v1"
+
+
+@lru_cache(maxsize=1)
+def _redis():
+    url = os.getenv("REDIS_URL")
+    return redis.Redis.from_url(url, decode_responses=True) if url else None
+
+
+@lru_cache(maxsize=1)
+def _aioredis():
+    url = os.getenv("REDIS_URL")
+    return aioredis.Redis.from_url(url, decode_responses=True) if url else None
+
+
+def _cache_key(prompt: str) -> str:
+    digest = hashlib.sha256(f"{CACHE_VERSION}\0{MODEL_NAME}\0{prompt}".encode()).hexdigest()
+    return f"gem:{digest}"
+
+
+def _cache_ttl() -> int:
+    return int(os.getenv("LLM_CACHE_TTL_SECONDS", "86400"))
+
+
+# In-process LRU in front of Redis, keyed the same way: re-runs of the same PR
+# on one worker are answered without any network round trip, with or without
+# Redis configured.
+_local_lock = threading.Lock()
+
+
+@lru_cache(maxsize=1)
+def _local_cache() -> TTLCache:
+    return TTLCache(maxsize=int(os.getenv("LLM_LOCAL_CACHE_SIZE", "1024")), ttl=_cache_ttl())
+
+
+def _local_get(key: str):
+    with _local_lock:
+        return _local_cache().get(key)
+
+
+def _local_set(key: str, response_text: str):
+    with _local_lock:
+        _local_cache()[key] = response_text
+
+
+def _is_json(response_text: str) -> bool:
+    """Whether a response parses; truncated or blocked responses must never be cached."""
+    try:
+        orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        return False
+    return True
+
+
+# Characters that can change JSON nesting; everything else is skipped in C
+_JSON_STRUCTURE = re.compile(r'[\[\]{}"\\]')
+
+
+class _JsonEndScanner:
+    """Bracket-depth scanner that finds where a streamed top-level JSON value ends."""
+
+    def __init__(self):
+        self.depth = 0
+        self.in_string = False
+        self.escaped = False  # previous chunk ended on a backslash inside a string
+
+    def feed(self, text: str) -> int:
+        """Consume the next chunk; return the index just past the closing bracket, or -1."""
+        skip = 0 if self.escaped else -1
+        self.escaped = False
+        for match in _JSON_STRUCTURE.finditer(text):
+            if match.start() == skip:
+                continue
+            char = match.group()
+            if self.in_string:
+                if char == "\\":
+                    skip = match.end()
+                    self.escaped = skip == len(text)
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "[{":
+                self.depth += 1
+            elif char in "]}":
+                self.depth -= 1
+                if self.depth == 0:
+                    return match.end()
+        return -1
+
+
+def _read_json_stream(stream) -> str:
+    """
+    Accumulate streamed response chunks until the top-level JSON value closes.
+
+    Reading stops as soon as the value is complete, so trailing whitespace the
+    model sometimes keeps emitting in JSON mode is never waited for.
+    """
+    scanner = _JsonEndScanner()
+    buffer = []
+    for chunk in stream:
+        text = chunk.text or ""
+        end = scanner.feed(text)
+        if end >= 0:
+            buffer.append(text[:end])
+            break
+        buffer.append(text)
+    return "".join(buffer)
+
+
+def _generate_uncached(client, prompt: str, config: types.GenerateContentConfig) -> str:
+    return _read_json_stream(client.models.generate_content_stream(
+        model=MODEL_NAME,
+        contents=[prompt],
+        config=config
+    ))
+
+
+def generate_json(client, prompt: str, config: types.GenerateContentConfig = GENERATION_CONFIG) -> str:
+    """Run a single streamed JSON-mode Gemini call and return the response text."""
+    key = _cache_key(prompt)
+    cached = _local_get(key)
+    if cached is not None:
+        return cached
+
+    cache = _redis()
+    if cache is not None:
+        try:
+            cached = cache.get(key)
+            if cached is not None:
+                _local_set(key, cached)
+                return cached
+        except redis.RedisError:
+            pass
+
+    response_text = _generate_uncached(client, prompt, config)
+    if _is_json(response_text):
+        _local_set(key, response_text)
+        if cache is not None:
+            try:
+                cache.setex(key, _cache_ttl(), response_text)
+            except redis.RedisError:
+                pass
+    return response_text
+
+
+async def generate_json_async(client, semaphore: asyncio.Semaphore, prompt: str,
+                              config: types.GenerateContentConfig = GENERATION_CONFIG) -> str:
+    """
+    Async variant of generate_json.
+
+    The semaphore comes from get_semaphore for the calling agent's API key and
+    caps how many requests are in flight against that key at once, so a wide
+    asyncio.gather fan-out does not trip the provider's rate limits. Cache hits
+    are served before the semaphore is taken.
+
+    The stream is consumed in a dedicated worker thread: google-genai's aio
+    stream reads the SSE body synchronously on the event loop, which would
+    serialize the fan-out.
+    """
+    key = _cache_key(prompt)
+    cached = _local_get(key)
+    if cached is not None:
+        return cached
+
+    cache = _aioredis()
+    if cache is not None:
+        try:
+            cached = await cache.get(key)
+            if cached is not None:
+                _local_set(key, cached)
+                return cached
+        except redis.RedisError:
+            pass
+
+    async with semaphore:
+        response_text = await asyncio.get_running_loop().run_in_executor(
+            _stream_executor(), _generate_uncached, client, prompt, config
+        )
+
+    if _is_json(response_text):
+        _local_set(key, response_text)
+        if cache is not None:
+            try:
+                await cache.setex(key, _cache_ttl(), response_text)
+            except redis.RedisError:
+                pass
+    return response_text
+
+
+def _merge_chunk_results(results: list):
+    """
+    Concatenate per-chunk issue lists, or per-category lists for dict results.
+    Scalar fields of dict results keep the first chunk's value, except numbers
+    (scores), which keep the highest.
+    """
+    if all(isinstance(result, dict) for result in results):
+        merged = {}
+        for result in results:
+            for key, value in result.items():
+                if isinstance(value, list):
+                    merged.setdefault(key, []).extend(value)
+                elif key not in merged:
+                    merged[key] = value
+                elif isinstance(value, (int, float)):
+                    merged[key] = max(merged[key], value)
+        return merged
+
+    merged = []
+    for result in results:
+        merged.extend(result)
+    return merged
+
+
+def _empty_result(config: types.GenerateContentConfig):
+    """The no-findings shape for config's schema: [] or an empty list per category."""
+    schema = config.response_schema
+    if isinstance(schema, dict) and schema.get("type") == "OBJECT":
+        return {name: [] for name, prop in schema["properties"].items() if prop.get("type") == "ARRAY"}
+    return []
+
+
+def parse_result(response_text: str, config: types.GenerateContentConfig = GENERATION_CONFIG):
+    """
+    Parse a JSON-mode response. Empty (safety-blocked) or truncated (MAX_TOKENS)
+    responses yield the empty shape for config instead of failing the review.
+    """
+    try:
+        return orjson.loads(response_text)
+    except orjson.JSONDecodeError:
+        return _empty_result(config)
+
+
+async def generate_file_async(client, semaphore: asyncio.Semaphore, build_prompt, filename: str, patch: str,
+                              config: types.GenerateContentConfig = GENERATION_CONFIG):
+    """
+    Review one file's patch and return the parsed JSON result.
+
+    The patch is first compacted to its changed lines and their immediate
+    context. Patches still over patch_utils.MAX_PATCH_CHARS are split on hunk
+    boundaries and the chunks are reviewed concurrently, so one huge file
+    neither blows up a single prompt nor holds a request open far longer than
+    the rest.
+    """
+    chunks = split_patch(compact_patch(patch))
+    responses = await asyncio.gather(*(
+        generate_json_async(client, semaphore, build_prompt(filename, chunk), config) for chunk in chunks
+    ))
+    results = [parse_result(response_text, config) for response_text in responses]
+    return results[0] if len(results) == 1 else _merge_chunk_results(results)
+
+
+def json_config(response_schema: dict) -> types.GenerateContentConfig:
+    """
+    JSON-mode generation config whose output is constrained to response_schema
+    (an OpenAPI-style dict), so prompts need not spell out the JSON format.
+    """
+    return types.GenerateContentConfig(
+        temperature=0.1,
+        response_mime_type="application/json",
+        response_schema=response_schema
+    )
+
+
+def batch_schema(issue_schema: dict) -> dict:
+    """
+    Response schema for batched calls: one {"filename", "issues"} object per
+    file, each issue following the calling agent's issue_schema.
+    """
+    return {
+        "type": "ARRAY",
+        "items": {
+            "type": "OBJECT",
+            "properties": {
+                "filename": {"type": "STRING"},
+                "issues": {"type": "ARRAY", "items": issue_schema}
+            },
+            "required": ["filename", "issues"]
+        }
+    }
+
+
+BATCH_INSTRUCTIONS = """
+
+Batch mode:
+The patch above contains several files, each starting with a "FILE: <name>" header.
+Review every file independently, applying the rules above to each one.
+Return one entry per file, holding its "filename" and that file's findings.
+Use empty lists for files without problems."""
+
+
+async def generate_batch_async(client, semaphore: asyncio.Semaphore, build_prompt, files: list,
+                              config: types.GenerateContentConfig, file_config: types.GenerateContentConfig,
+                              field: str = "issues") -> dict:
+    """
+    Review several (filename, patch) pairs with a single Gemini call.
+
+    build_prompt is the agent's single-file prompt builder; the files are
+    inlined as FILE-headed sections and BATCH_INSTRUCTIONS switch the output
+    to one entry per file. config should constrain the response with
+    batch_schema. Returns a dict mapping every filename to its entry's
+    `field` (its issues), or to the whole entry minus "filename" when field
+    is None.
+
+    Files the model returned no entry for (echoed under another name, or
+    lost to a truncated or blocked response) are reviewed again on their own with generate_file_async and file_config, so
+    a dropped entry never reads as a file without issues.
+    """
+    patches = "\n\n".join(f"FILE: {filename}\n{compact_patch(patch)}" for filename, patch in files)
+    prompt = build_prompt("multiple files (see FILE headers)", patches) + BATCH_INSTRUCTIONS
+    response_text = await generate_json_async(client, semaphore, prompt, config)
+
+    # A truncated or blocked response leaves every file missing
+    entries = parse_result(response_text)
+    if not isinstance(entries, list):
+        entries = []
+
+    results = {}
+    wanted = {filename for filename, _ in files}
+    for entry in entries:
+        if not isinstance(entry, dict):
+            continue
+        filename = entry.pop("filename", None)
+        if filename in wanted and filename not in results:
+            results[filename] = entry.get(field, []) if field else entry
+
+    missing = [(filename, patch) for filename, patch in files if filename not in results]
+    if missing:
+        reviews = await asyncio.gather(*(
+            generate_file_async(client, semaphore, build_prompt, filename, patch, file_config)
+            for filename, patch in missing
+        ))
+        results.update(zip((filename for filename, _ in missing), reviews))
+    return {filename: results[filename] for filename, _ in files}
@@ -1,14 +1,132 @@
-import requests
+import httpx
+from cachetools import TTLCache
+from patch_utils import Patch
+import asyncio
+import itertools
+import time
+import os
+from functools import lru_cache
+from config import ensure_env
 
-def get_details(owner,repo,pr_number):
+# Status codes retried with exponential backoff; connection failures are
+# retried by the transport itself.
+_RETRY_STATUSES = {429, 502, 503, 504}
+_MAX_RETRIES = 3
+_BACKOFF_SECONDS = 0.3
+
+
+def create_http_client() -> httpx.AsyncClient:
+    """
+    Build the shared GitHub client. HTTP/2 lets concurrent requests multiplex
+    over one keep-alive TCP + TLS connection instead of one connection each.
+    """
+    return httpx.AsyncClient(
+        timeout=15,
+        headers={"Accept": "application/vnd.github+json"},
+        transport=httpx.AsyncHTTPTransport(
+            http2=True,
+            retries=_MAX_RETRIES,
+            limits=httpx.Limits(max_connections=50, max_keepalive_connections=20)
+        )
+    )
+
+
+# Requests are spread round-robin over every configured token (GITHUB_TOKENS is
+# a comma-separated list, GITHUB_TOKEN a single token), multiplying the primary
+# rate limit. Tokens reported as exhausted are skipped until their window resets.
+_rate_limits = {}  # token -> (remaining, reset_at epoch seconds)
+
+
+@lru_cache(maxsize=1)
+def _token_pool():
+    """The configured tokens and a round-robin iterator over them, read on first use."""
+    ensure_env()
+    tokens = [t.strip() for t in (os.getenv("GITHUB_TOKENS") or os.getenv("GITHUB_TOKEN") or "").split(",") if t.strip()]
+    return tokens, itertools.cycle(tokens)
+
+
+def _next_token():
+    """Pick the next token with rate limit left, or None when running unauthenticated."""
+    tokens, token_cycle = _token_pool()
+    if not tokens:
+        return None
+    now = time.time()
+    for _ in range(len(tokens)):
+        token = next(token_cycle)
+        remaining, reset_at = _rate_limits.get(token, (1, 0))
+        if remaining > 0 or reset_at <= now:
+            return token
+    # Every token is exhausted; the one whose window resets first recovers soonest
+    return min(tokens, key=lambda t: _rate_limits[t][1])
+
+
+def _has_spare_token() -> bool:
+    """Whether some configured token still has rate limit left."""
+    now = time.time()
+    return any(remaining > 0 or reset_at <= now
+               for remaining, reset_at in (_rate_limits.get(t, (1, 0)) for t in _token_pool()[0]))
+
+
+def _rate_limited(response) -> bool:
+    """GitHub reports an exhausted primary rate limit as 403 (or 429) with none remaining."""
+    return response.status_code in (403, 429) and response.headers.get("X-RateLimit-Remaining") == "0"
+
+
+def _record_rate_limit(token, response):
+    remaining = response.headers.get("X-RateLimit-Remaining")
+    reset_at = response.headers.get("X-RateLimit-Reset")
+    if token and remaining is not None and reset_at is not None:
+        _rate_limits[token] = (int(remaining), int(reset_at))
+
+
+# url -> (fetched_at, etag, body, next_url). Entries younger than
+# _CACHE_FRESH_SECONDS are served without touching the network; older ones are
+# revalidated with If-None-Match, and GitHub's 304 replies are free of rate limit.
+_CACHE_FRESH_SECONDS = 60
+_cache = TTLCache(maxsize=1024, ttl=3600)
+
+
+async def _get_json(http, url, error_message):
+    """GET a GitHub API URL through the ETag cache, returning (body, next_page_url)."""
+    cached = _cache.get(url)
+
+    if cached and time.monotonic() - cached[0] < _CACHE_FRESH_SECONDS:
+        return cached[2], cached[3]
+
+    headers = {"If-None-Match": cached[1]} if cached and cached[1] else {}
+    for attempt in range(_MAX_RETRIES + 1):
+        token = _next_token()
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        response = await http.get(url, headers=headers)
+        _record_rate_limit(token, response)
+        if attempt == _MAX_RETRIES:
+            break
+        if _rate_limited(response):
+            # Another token may still have budget: retry with it straight away
+            if not _has_spare_token():
+                break
+            continue
+        if response.status_code not in _RETRY_STATUSES:
+            break
+        await asyncio.sleep(_BACKOFF_SECONDS * 2 ** attempt)
+
+    if response.status_code == 304 and cached:
+        body, next_url = cached[2], cached[3]
+    elif response.status_code == 200:
+        body, next_url = response.json(), response.links.get("next", {}).get("url")
+    else:
+        raise ValueError(error_message)
+
+    etag = response.headers.get("ETag") or (cached[1] if cached else None)
+    _cache[url] = (time.monotonic(), etag, body, next_url)
+    return body, next_url
+
+
+async def get_details(http, owner, repo, pr_number):
     """Fetch GitHub PR details using GitHub API."""
     url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}"
-    response = requests.get(url)
-    
-    if response.status_code != 200:
-        raise ValueError("Failed to fetch PR details from GitHub API")
-    
-    pr_data = response.json()
+    pr_data, _ = await _get_json(http, url, "Failed to fetch PR details from GitHub API")
     return {
         "title": pr_data.get("title"),
         "body": pr_data.get("body"),
@@ -17,27 +135,33 @@ def get_details(owner,repo,pr_number):
         "updated_at": pr_data.get("updated_at"),
         "merged": pr_data.get("merged"),
         "merge_commit_sha": pr_data.get("merge_commit_sha"),
+        "changed_files": pr_data.get("changed_files"),
     }
 
-def get_patches(owner, repo, pr_number):
+async def get_patches(http, owner, repo, pr_number) -> list[Patch]:
     """Fetch PR file diffs/patches for code review."""
-    url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files"
-    response = requests.get(url)
-
-    if response.status_code != 200:
-        raise ValueError("Failed to fetch PR diffs")
-
-    data = response.json()
+    # 100 is the largest page GitHub allows (default is 30), so most PRs need a
+    # single request; larger ones follow the Link header to the next page.
+    url = f"https://api.github.com/repos/{owner}/{repo}/pulls/{pr_number}/files?per_page=100"
+    data = []
+    while url:
+        page, url = await _get_json(http, url, "Failed to fetch PR diffs")
+        data.extend(page)
 
     patches = []
     for file in data:
-        patches.append({
-            "filename": file["filename"],
-            "status": file.get("status", ""),  # added, modified, removed, renamed
-            "additions": file.get("additions", 0),
-            "deletions": file.get("deletions", 0),
-            "changes": file.get("changes", 0),
-            "patch": file.get("patch", "")  # The actual diff
-        })
+        # Deleted files and files without a textual diff (binary, too large,
+        # pure renames) have nothing to review, so they never leave this function
+        patch = file.get("patch")
+        if not patch or patch.isspace() or file.get("status") == "removed":
+            continue
+        patches.append(Patch(
+            filename=file["filename"],
+            status=file.get("status", ""),
+            additions=file.get("additions", 0),
+            deletions=file.get("deletions", 0),
+            changes=file.get("changes", 0),
+            patch=patch
+        ))
     
     return patches
\ No newline at end of file
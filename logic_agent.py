@@ -1,34 +1,47 @@
-from google import genai
-from google.genai import types
+from gemini_client import (get_client, get_semaphore, generate_json, generate_file_async, generate_batch_async,
+                           parse_result, json_config, batch_schema)
+from config import ensure_env
+from patch_utils import compact_patch
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY_LOGIC"))
+def _client():
+    ensure_env()
+    return get_client(os.getenv("GEMINI_API_KEY_LOGIC"))
 
 
-def analyze_file_logic(filename: str, patch: str) -> list:
-    """
-    Analyze logical correctness of a single file's code changes.
-    
-    Args:
-        filename: Name of the file being reviewed
-        patch: The diff patch content
-    
-    Returns:
-        List of logic issues in JSON format
-    """
-    prompt = f"""You are a Logic Review Agent for GitHub Pull Requests.
+def _semaphore():
+    ensure_env()
+    return get_semaphore(os.getenv("GEMINI_API_KEY_LOGIC"))
+
+
+ISSUE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "line": {"type": "INTEGER", "nullable": True, "description": "Line number in the patch"},
+        "issue": {"type": "STRING", "description": "Short logic issue"},
+        "suggestion": {"type": "STRING", "description": "How to fix it"}
+    },
+    "required": ["issue", "suggestion"]
+}
+
+RESPONSE_CONFIG = json_config({"type": "ARRAY", "items": ISSUE_SCHEMA})
+BATCH_CONFIG = json_config(batch_schema(ISSUE_SCHEMA))
+
+PROMPT_PREFIX = """You are a Logic Review Agent for GitHub Pull Requests.
 
 Your task:
 Analyze only the LOGICAL correctness of the code changes in the patch below.
 Focus strictly on logic bugs, incorrect conditions, wrong return values, code that may break, or potential unintended behavior.
 
 Input:
-- File: {filename}
+- File: """
+
+PROMPT_MID = """
 - Code Patch:
-{patch}
+"""
+
+PROMPT_SUFFIX = """
 
 Rules:
 1. Consider ONLY the changed lines shown in the patch.
@@ -37,32 +50,45 @@ Rules:
 4. Reference the exact line numbers from the patch when possible.
 5. If no logic issues exist, return an empty list [].
 
-Output Format:
-Return ONLY valid JSON in this exact format:
-
-[
-  {{
-    "line": <line_number or null>,
-    "issue": "<short logic issue>",
-    "suggestion": "<how to fix it>"
-  }}
-]
-
-Important:
-- NO explanations outside JSON.
-- NO markdown.
-- Keep comments short and actionable."""
+Return the issues as a JSON list following the response schema.
+Keep comments short and actionable."""
+
+
+def _build_prompt(filename: str, patch: str) -> str:
+    return "".join((PROMPT_PREFIX, filename, PROMPT_MID, patch, PROMPT_SUFFIX))
+
+
+def analyze_file_logic(filename: str, patch: str) -> list:
+    """
+    Analyze logical correctness of a single file's code changes.
     
-    response = client.models.generate_content(
-        model="models/gemini-1.5-flash",
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            temperature=0.1,
-            response_mime_type="application/json"
-        )
-    )
+    Args:
+        filename: Name of the file being reviewed
+        patch: The diff patch content
     
-    return response.text
+    Returns:
+        List of logic issues (parsed JSON)
+    """
+    return parse_result(generate_json(_client(), _build_prompt(filename, compact_patch(patch)), RESPONSE_CONFIG),
+                        RESPONSE_CONFIG)
 
 
+async def analyze_file_logic_async(filename: str, patch: str) -> list:
+    """
+    Async variant of analyze_file_logic, bounded by this agent's semaphore.
+    Large patches are reviewed in hunk-aligned chunks and the issues merged.
+    """
+    return await generate_file_async(_client(), _semaphore(), _build_prompt, filename, patch, RESPONSE_CONFIG)
+
 
+async def analyze_files_logic_async(files: list) -> dict:
+    """
+    Analyze several small files' logic with a single Gemini call.
+    
+    Args:
+        files: List of (filename, patch) tuples
+    
+    Returns:
+        Dict mapping each filename to its list of logic issues
+    """
+    return await generate_batch_async(_client(), _semaphore(), _build_prompt, files, BATCH_CONFIG, RESPONSE_CONFIG)
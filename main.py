@@ -1,20 +1,36 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Depends, Request
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse
+from fastapi.responses import FileResponse, ORJSONResponse
 from schemas import InputLink
 from pydantic import ValidationError
-from get_repo_details import get_details, get_patches
-from single_agent import analyze_pr_full
-from logic_agent import analyze_file_logic
-from security_agent import analyze_file_security
-from readability_agent import analyze_file_readability
-from performance_agent import analyze_file_performance
+from get_repo_details import get_details, get_patches, create_http_client
+from single_agent import analyze_pr_full, analyze_file_all_async
+from logic_agent import analyze_file_logic_async, analyze_files_logic_async
+from security_agent import analyze_file_security_async, analyze_files_security_async
+from readability_agent import analyze_file_readability_async, analyze_files_readability_async
+from performance_agent import analyze_file_performance_async, analyze_files_performance_async
 from response_models import format_single_review, format_full_review
+from patch_utils import pack_patches, is_reviewable
+from contextlib import asynccontextmanager
+import asyncio
+import httpx
 import time
-import json
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # One pooled HTTP/2 client to GitHub shared by every request
+    app.state.http = create_http_client()
+    yield
+    await app.state.http.aclose()
+
+
+def get_http_client(request: Request) -> httpx.AsyncClient:
+    return request.app.state.http
+
+
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
 
 # Enable CORS for frontend
 app.add_middleware(
@@ -48,36 +64,36 @@ async def post_link(link_data: InputLink):
         raise HTTPException(status_code=400, detail=str(e))
     
 @app.get("/get_pr_details/")
-async def get_pr_details(link: InputLink):
+async def get_pr_details(link: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
     try:
-        pr_details = link.get_pr_details()
-        details = get_details(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
+        pr = link.pr_ref
+        details = await get_details(http, pr.owner, pr.repo, pr.pr_number)
         return details
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/get_pr_diffs/")
-async def get_pr_diffs(link_data: InputLink):
+async def get_pr_diffs(link_data: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
     """Get PR file diffs for code review."""
     try:
-        pr_details = link_data.get_pr_details()
+        pr = link_data.pr_ref
         
-        # Get basic PR details
-        details = get_details(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
-        
-        # Get file patches/diffs
-        patches = get_patches(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
+        # Fetch PR details and file patches/diffs concurrently
+        details, patches = await asyncio.gather(
+            get_details(http, pr.owner, pr.repo, pr.pr_number),
+            get_patches(http, pr.owner, pr.repo, pr.pr_number)
+        )
         
         return {
             "pr_info": {
-                "owner": pr_details["owner"],
-                "repo": pr_details["repo"],
-                "pr_number": pr_details["pr_number"],
+                "owner": pr.owner,
+                "repo": pr.repo,
+                "pr_number": pr.pr_number,
                 "title": details["title"],
                 "state": details["state"],
                 "merged": details["merged"]
             },
-            "files_changed": len(patches),
+            "files_changed": details["changed_files"],
             "diffs": patches
         }
     except ValueError as e:
@@ -85,64 +101,48 @@ async def get_pr_diffs(link_data: InputLink):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error fetching PR diffs: {str(e)}")
     
-@app.post("/review_logic/")
-async def review_logic(link_data: InputLink):
-    """Review the logic of code changes in a PR."""
+async def run_single_review(link_data: InputLink, http: httpx.AsyncClient, review_type: str,
+                            analyze_file, analyze_files) -> dict:
+    """
+    Run one review type over every file in a PR.
+    
+    Small patches are packed into shared Gemini requests (analyze_files) and
+    oversized ones go through the per-file agent (analyze_file); all requests
+    run concurrently.
+    """
     start_time = time.time()
     try:
-        pr_details = link_data.get_pr_details()
-        diffs = get_patches(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
+        pr = link_data.pr_ref
+        diffs = await get_patches(http, pr.owner, pr.repo, pr.pr_number)
         
         pr_info = {
-            "owner": pr_details["owner"],
-            "repo": pr_details["repo"],
-            "pr_number": pr_details["pr_number"],
+            "owner": pr.owner,
+            "repo": pr.repo,
+            "pr_number": pr.pr_number,
         }
         
-        reviews = []
-        for diff in diffs:
-            if not diff.get('patch'):
-                continue
-            file_review = analyze_file_logic(diff['filename'], diff['patch'])
-            reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "logic_issues": file_review
-            })
+        reviewable = [diff for diff in diffs if is_reviewable(diff)]
         
-        result = format_single_review(pr_info, reviews, "logic")
-        result["review_time_seconds"] = round(time.time() - start_time, 2)
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
-@app.post("/review_security/")
-async def review_security(link_data: InputLink):
-    """Review the security of code changes in a PR."""
-    start_time = time.time()
-    try:
-        pr_details = link_data.get_pr_details()
-        diffs = get_patches(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
+        async def review_batch(batch):
+            if len(batch) == 1:
+                return {batch[0].filename: await analyze_file(batch[0].filename, batch[0].patch)}
+            return await analyze_files([(diff.filename, diff.patch) for diff in batch])
         
-        pr_info = {
-            "owner": pr_details["owner"],
-            "repo": pr_details["repo"],
-            "pr_number": pr_details["pr_number"],
-        }
+        file_reviews = {}
+        for batch_result in await asyncio.gather(*(review_batch(batch) for batch in pack_patches(reviewable))):
+            file_reviews.update(batch_result)
         
         reviews = []
-        for diff in diffs:
-            if not diff.get('patch'):
-                continue
-            file_review = analyze_file_security(diff['filename'], diff['patch'])
+        for diff in reviewable:
             reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "security_issues": file_review
+                "filename": diff.filename,
+                "status": diff.status,
+                f"{review_type}_issues": file_reviews.get(diff.filename, [])
             })
         
-        result = format_single_review(pr_info, reviews, "security")
+        # Parsing and aggregating large issue payloads runs in a worker thread so
+        # other in-flight reviews keep being served meanwhile
+        result = await asyncio.to_thread(format_single_review, pr_info, reviews, review_type)
         result["review_time_seconds"] = round(time.time() - start_time, 2)
         return result
     except ValueError as e:
@@ -150,105 +150,85 @@ async def review_security(link_data: InputLink):
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
+@app.post("/review_logic/")
+async def review_logic(link_data: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
+    """Review the logic of code changes in a PR."""
+    return await run_single_review(link_data, http, "logic", analyze_file_logic_async, analyze_files_logic_async)
+
+@app.post("/review_security/")
+async def review_security(link_data: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
+    """Review the security of code changes in a PR."""
+    return await run_single_review(link_data, http, "security", analyze_file_security_async,
+                                   analyze_files_security_async)
+
 @app.post("/review_readability/")
-async def review_readability(link_data: InputLink):
+async def review_readability(link_data: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
     """Review the readability of code changes in a PR."""
-    start_time = time.time()
-    try:
-        pr_details = link_data.get_pr_details()
-        diffs = get_patches(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
-        
-        pr_info = {
-            "owner": pr_details["owner"],
-            "repo": pr_details["repo"],
-            "pr_number": pr_details["pr_number"],
-        }
-        
-        reviews = []
-        for diff in diffs:
-            if not diff.get('patch'):
-                continue
-            file_review = analyze_file_readability(diff['filename'], diff['patch'])
-            reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "readability_issues": file_review
-            })
-        
-        result = format_single_review(pr_info, reviews, "readability")
-        result["review_time_seconds"] = round(time.time() - start_time, 2)
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+    return await run_single_review(link_data, http, "readability", analyze_file_readability_async,
+                                   analyze_files_readability_async)
 
 @app.post("/review_performance/")
-async def review_performance(link_data: InputLink):
+async def review_performance(link_data: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
     """Review the performance of code changes in a PR."""
-    start_time = time.time()
-    try:
-        pr_details = link_data.get_pr_details()
-        diffs = get_patches(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
-        
-        pr_info = {
-            "owner": pr_details["owner"],
-            "repo": pr_details["repo"],
-            "pr_number": pr_details["pr_number"],
-        }
-        
-        reviews = []
-        for diff in diffs:
-            if not diff.get('patch'):
-                continue
-            file_review = analyze_file_performance(diff['filename'], diff['patch'])
-            reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "performance_issues": file_review
-            })
-        
-        result = format_single_review(pr_info, reviews, "performance")
-        result["review_time_seconds"] = round(time.time() - start_time, 2)
-        return result
-    except ValueError as e:
-        raise HTTPException(status_code=400, detail=str(e))
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
+    return await run_single_review(link_data, http, "performance", analyze_file_performance_async,
+                                   analyze_files_performance_async)
+
+def split_by_category(diffs: list, file_reviews: list) -> tuple:
+    """
+    Turn per-file multi-aspect results ({"logic": [...], "security": [...], ...})
+    into the four per-category review lists format_full_review expects.
+    """
+    logic_reviews = []
+    security_reviews = []
+    readability_reviews = []
+    performance_reviews = []
+    
+    for diff, file_review in zip(diffs, file_reviews):
+        logic_reviews.append({
+            "filename": diff.filename,
+            "status": diff.status,
+            "logic_issues": file_review.get('logic', [])
+        })
+        security_reviews.append({
+            "filename": diff.filename,
+            "status": diff.status,
+            "security_issues": file_review.get('security', [])
+        })
+        readability_reviews.append({
+            "filename": diff.filename,
+            "status": diff.status,
+            "readability_issues": file_review.get('readability', [])
+        })
+        performance_reviews.append({
+            "filename": diff.filename,
+            "status": diff.status,
+            "performance_issues": file_review.get('performance', [])
+        })
+    
+    return logic_reviews, security_reviews, readability_reviews, performance_reviews
 
 @app.post("/comprehensive_review/")
-async def comprehensive_review(input_link: InputLink):
+async def comprehensive_review(input_link: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
     """Get comprehensive PR review using single AI agent analyzing all aspects."""
     start_time = time.time()
     try:
-        pr_details = input_link.get_pr_details()
-        owner = pr_details['owner']
-        repo = pr_details['repo']
-        pr_number = pr_details['pr_number']
-        
-        patches = get_patches(owner, repo, pr_number)
-        
-        # Combine all patches into single string for comprehensive analysis
-        all_patches = ""
-        for patch in patches:
-            all_patches += f"\n{'='*60}\n"
-            all_patches += f"FILE: {patch['filename']}\n"
-            all_patches += f"STATUS: {patch['status']}\n"
-            all_patches += f"CHANGES: +{patch['additions']} -{patch['deletions']}\n"
-            all_patches += f"{'='*60}\n"
-            all_patches += patch.get('patch', 'No patch available') + "\n"
+        pr = input_link.pr_ref
+        patches = await get_patches(http, pr.owner, pr.repo, pr.pr_number)
+        reviewable = [patch for patch in patches if is_reviewable(patch)]
+        pr_info = {
+            "owner": pr.owner,
+            "repo": pr.repo,
+            "pr_number": pr.pr_number
+        }
         
-        # Single comprehensive analysis
-        review_result = analyze_pr_full(all_patches)
-        result = json.loads(review_result)
+        # Files are reviewed in small packed batches and the PR-level report is
+        # assembled locally, instead of one prompt carrying every patch
+        results = await analyze_pr_full(reviewable)
+        result = await asyncio.to_thread(format_full_review, pr_info, *split_by_category(reviewable, results))
         
-        # Add metadata
-        result["success"] = True
-        result["pr_info"] = {
-            "owner": owner,
-            "repo": repo,
-            "pr_number": pr_number
-        }
+        summaries = [file_review['summary'] for file_review in results if file_review.get('summary')]
+        result["pr_summary"] = " ".join(summaries) if reviewable else "No reviewable changes in this PR."
+        result["risk_score"] = max((file_review.get('risk_score', 0) for file_review in results), default=0)
         result["review_time_seconds"] = round(time.time() - start_time, 2)
         
         return result
@@ -261,56 +241,27 @@ async def comprehensive_review(input_link: InputLink):
         raise HTTPException(status_code=500, detail=f"Error: {str(e)}")
 
 @app.post("/full_review/")
-async def full_review(link_data: InputLink):
+async def full_review(link_data: InputLink, http: httpx.AsyncClient = Depends(get_http_client)):
     """Complete code review covering logic, security, readability, and performance."""
     start_time = time.time()
     try:
-        pr_details = link_data.get_pr_details()
-        diffs = get_patches(pr_details["owner"], pr_details["repo"], pr_details["pr_number"])
+        pr = link_data.pr_ref
+        diffs = await get_patches(http, pr.owner, pr.repo, pr.pr_number)
         
         pr_info = {
-            "owner": pr_details["owner"],
-            "repo": pr_details["repo"],
-            "pr_number": pr_details["pr_number"],
+            "owner": pr.owner,
+            "repo": pr.repo,
+            "pr_number": pr.pr_number,
         }
         
-        logic_reviews = []
-        security_reviews = []
-        readability_reviews = []
-        performance_reviews = []
+        reviewable = [diff for diff in diffs if is_reviewable(diff)]
         
-        for diff in diffs:
-            if not diff.get('patch'):
-                continue
-            
-            logic_review = analyze_file_logic(diff['filename'], diff['patch'])
-            security_review = analyze_file_security(diff['filename'], diff['patch'])
-            readability_review = analyze_file_readability(diff['filename'], diff['patch'])
-            performance_review = analyze_file_performance(diff['filename'], diff['patch'])
-            
-            logic_reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "logic_issues": logic_review
-            })
-            security_reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "security_issues": security_review
-            })
-            readability_reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "readability_issues": readability_review
-            })
-            performance_reviews.append({
-                "filename": diff['filename'],
-                "status": diff.get('status', None),
-                "performance_issues": performance_review
-            })
+        # One multi-aspect Gemini call per file, all files in flight at once
+        results = await asyncio.gather(*(
+            analyze_file_all_async(diff.filename, diff.patch) for diff in reviewable
+        ))
         
-        result = format_full_review(pr_info, logic_reviews, security_reviews, 
-                                 readability_reviews, performance_reviews)
+        result = await asyncio.to_thread(format_full_review, pr_info, *split_by_category(reviewable, results))
         result["review_time_seconds"] = round(time.time() - start_time, 2)
         return result
     except ValueError as e:
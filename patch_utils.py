@@ -0,0 +1,243 @@
+from dataclasses import dataclass
+import os
+import re
+
+# Lockfiles, vendored/third-party trees, generated code and Markdown docs:
+# reviewing them costs a full LLM call and never produces actionable feedback
+# from the code-focused agents.
+SKIP_PATTERN = re.compile(
+    r"(^|/)(package-lock\.json|yarn\.lock|pnpm-lock\.yaml|poetry\.lock|Pipfile\.lock|Cargo\.lock|go\.sum)$"
+    r"|(^|/)(vendor|node_modules)/"
+    r"|\.min\.(js|css)$|\.pb\.go$|_pb2\.py$"
+    r"|(?i:\.(md|markdown)$)"
+)
+
+BINARY_EXTENSIONS = {".png", ".jpg", ".jpeg", ".gif", ".ico", ".pdf", ".gz", ".zip", ".jar", ".woff", ".woff2"}
+
+# Rough size cap for one batched review request, in patch characters
+BATCH_CHAR_BUDGET = 12000
+
+# Files per batched request; the response for many small files can otherwise
+# outgrow the model's output token limit and come back truncated
+BATCH_MAX_FILES = 8
+
+# Patches above this size are reviewed in hunk-aligned chunks
+MAX_PATCH_CHARS = 8000
+
+_HUNK_START = re.compile(r"(?m)^(?=@@ )")
+
+_HUNK_HEADER = re.compile(r"@@ -(\d+)(?:,(\d+))? \+(\d+)(?:,(\d+))? @@(.*)")
+
+# Unchanged lines kept on each side of a change when compacting patches
+CONTEXT_LINES = 1
+
+
+@dataclass(slots=True)
+class Patch:
+    """One changed file of a PR as returned by get_patches."""
+    filename: str
+    status: str  # added, modified, renamed
+    additions: int
+    deletions: int
+    changes: int
+    patch: str  # The actual diff
+
+
+def is_reviewable(diff: Patch) -> bool:
+    """Whether a file diff is worth sending to the LLM at all."""
+    filename = diff.filename
+    if not diff.patch:
+        return False
+    if os.path.splitext(filename)[1].lower() in BINARY_EXTENSIONS:
+        return False
+    return SKIP_PATTERN.search(filename) is None
+
+
+def pack_patches(diffs: list[Patch], budget: int = BATCH_CHAR_BUDGET, max_files: int = BATCH_MAX_FILES) -> list:
+    """
+    Greedily pack diffs into batches whose combined patch size fits the budget,
+    with at most max_files diffs per batch.
+
+    Diffs are visited smallest first, so files of similar size end up in the
+    same request and one large file cannot hold up many small ones. A patch
+    larger than the budget always ends up in a batch of its own.
+    """
+    batches = []
+    current = []
+    current_size = 0
+    for diff in sorted(diffs, key=lambda d: len(d.patch)):
+        size = len(diff.patch)
+        if current and (current_size + size > budget or len(current) >= max_files):
+            batches.append(current)
+            current = []
+            current_size = 0
+        current.append(diff)
+        current_size += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def split_patch(patch: str, max_chars: int = MAX_PATCH_CHARS) -> list:
+    """
+    Split a large patch on hunk boundaries into chunks of at most max_chars.
+
+    Consecutive hunks are grouped until the limit is reached. A single hunk
+    larger than the limit (every newly added file is one hunk) is first cut
+    on line boundaries. Every chunk keeps its own "@@" headers, so line
+    numbers the model reports still refer to the real file and the per-chunk
+    results can be merged without re-basing.
+    """
+    if len(patch) <= max_chars:
+        return [patch]
+
+    chunks = []
+    current = ""
+    for hunk in _HUNK_START.split(patch):
+        if not hunk:
+            continue
+        for piece in _split_hunk(hunk, max_chars) if len(hunk) > max_chars else (hunk,):
+            if current and len(current) + len(piece) > max_chars:
+                chunks.append(current)
+                current = ""
+            current += piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def _format_range(start: int, count: int) -> str:
+    """Render one side of a hunk header; empty ranges point at the line before."""
+    if count == 0:
+        return f"{start - 1},0"
+    return str(start) if count == 1 else f"{start},{count}"
+
+
+def _line_positions(match: re.Match, body: list) -> list:
+    """(old, new) file line numbers at every line of the hunk whose header matched."""
+    # An empty side's start is the line before it ("-0,0" for added files)
+    old_no = int(match[1]) + (match[2] == "0")
+    new_no = int(match[3]) + (match[4] == "0")
+    positions = []
+    for line in body:
+        positions.append((old_no, new_no))
+        tag = line[:1]
+        if tag == "-":
+            old_no += 1
+        elif tag == "+":
+            new_no += 1
+        elif tag != "\\":
+            old_no += 1
+            new_no += 1
+    return positions
+
+
+def _run_header(run: list, position: tuple, heading: str) -> str:
+    """Recomputed "@@" header for a run of hunk lines starting at position."""
+    old_count = sum(1 for line in run if line[:1] not in ("+", "\\"))
+    new_count = sum(1 for line in run if line[:1] not in ("-", "\\"))
+    old_start, new_start = position
+    return f"@@ -{_format_range(old_start, old_count)} +{_format_range(new_start, new_count)} @@{heading}"
+
+
+def _split_hunk(hunk: str, max_chars: int) -> list:
+    """Cut one oversized hunk on line boundaries into pieces with their own headers."""
+    lines = hunk.split("\n")
+    trailing_newline = lines[-1] == ""
+    if trailing_newline:
+        lines.pop()
+    match = _HUNK_HEADER.match(lines[0])
+    if match is None:
+        return [hunk]
+    body = lines[1:]
+    positions = _line_positions(match, body)
+    budget = max_chars - len(lines[0]) - 16  # room for the recomputed header
+
+    pieces = []
+    start = 0
+    size = 0
+    for index, line in enumerate(body):
+        # "\ No newline at end of file" stays with the line before it
+        if index > start and size + len(line) + 1 > budget and not line.startswith("\\"):
+            run = body[start:index]
+            pieces.append("\n".join([_run_header(run, positions[start], match[5])] + run) + "\n")
+            start, size = index, 0
+        size += len(line) + 1
+    run = body[start:]
+    pieces.append("\n".join([_run_header(run, positions[start], match[5])] + run)
+                  + ("\n" if trailing_newline else ""))
+    return pieces
+
+
+def _compact_hunk(header: str, body: list, context: int) -> list:
+    match = _HUNK_HEADER.match(header)
+    if match is None:
+        return [header] + body
+    heading = match[5]
+
+    # (old, new) line numbers at every line, and which lines survive: changes
+    # plus `context` unchanged lines on each side
+    positions = _line_positions(match, body)
+    keep = [False] * len(body)
+    for index, line in enumerate(body):
+        if line[:1] in ("+", "-"):
+            for near in range(max(0, index - context), min(len(body), index + context + 1)):
+                keep[near] = True
+    for index, line in enumerate(body):
+        # "\ No newline at end of file" belongs to the line before it
+        if line.startswith("\\"):
+            keep[index] = index > 0 and keep[index - 1]
+
+    if all(keep):
+        return [header] + body
+
+    compacted = []
+    index = 0
+    while index < len(body):
+        if not keep[index]:
+            index += 1
+            continue
+        end = index
+        while end < len(body) and keep[end]:
+            end += 1
+        run = body[index:end]
+        compacted.append(_run_header(run, positions[index], heading))
+        compacted.extend(run)
+        index = end
+    return compacted
+
+
+def compact_patch(patch: str, context: int = CONTEXT_LINES) -> str:
+    """
+    Drop unchanged lines that are more than `context` lines away from a change.
+
+    The reviews only look at added and removed lines, so distant context just
+    costs input tokens. Each hunk is cut into runs of retained lines and every
+    run gets its own recomputed "@@" header, so line numbers the model reports
+    still refer to the real file. Patches with nothing to drop are returned
+    unchanged.
+    """
+    # Split on "\n" only, as git does: splitlines() would also break on
+    # form feeds, "\r" and other separators that can sit inside source lines
+    lines = patch.split("\n")
+    trailing_newline = lines[-1] == ""
+    if trailing_newline:
+        lines.pop()
+    compacted = []
+    header = None
+    body = []
+    for line in lines:
+        if line.startswith("@@ "):
+            if header is not None:
+                compacted.extend(_compact_hunk(header, body, context))
+            header, body = line, []
+        elif header is not None:
+            body.append(line)
+        # Anything before the first hunk (---/+++ file headers) is dropped
+    if header is None:
+        return patch
+    compacted.extend(_compact_hunk(header, body, context))
+
+    if compacted == lines:
+        return patch
+    return "\n".join(compacted) + ("\n" if trailing_newline else "")
@@ -1,26 +1,36 @@
-from google import genai
-from google.genai import types
+from gemini_client import (get_client, get_semaphore, generate_json, generate_file_async, generate_batch_async,
+                           parse_result, json_config, batch_schema)
+from config import ensure_env
+from patch_utils import compact_patch
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY_PERFORMANCE"))
+def _client():
+    ensure_env()
+    return get_client(os.getenv("GEMINI_API_KEY_PERFORMANCE"))
 
 
-def analyze_file_performance(filename: str, patch: str) -> list:
-    """
-    Analyze performance aspects of a single file's code changes.
-    
-    Args:
-        filename: Name of the file being reviewed
-        patch: The diff patch content
-        
-    
-    Returns:
-        List of performance issues in JSON format
-    """
-    prompt = f"""You are a Performance Review Agent for GitHub Pull Requests.
+def _semaphore():
+    ensure_env()
+    return get_semaphore(os.getenv("GEMINI_API_KEY_PERFORMANCE"))
+
+
+ISSUE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "line": {"type": "INTEGER", "nullable": True, "description": "Line number in the patch"},
+        "severity": {"type": "STRING", "enum": ["low", "medium", "high"]},
+        "issue": {"type": "STRING", "description": "Performance bottleneck"},
+        "suggestion": {"type": "STRING", "description": "Performance improvement"},
+        "fixed_code": {"type": "STRING", "nullable": True, "description": "Optimized code snippet"}
+    },
+    "required": ["severity", "issue", "suggestion"]
+}
+
+RESPONSE_CONFIG = json_config({"type": "ARRAY", "items": ISSUE_SCHEMA})
+BATCH_CONFIG = json_config(batch_schema(ISSUE_SCHEMA))
+
+PROMPT_PREFIX = """You are a Performance Review Agent for GitHub Pull Requests.
 
 Your job is to analyze ONLY the PERFORMANCE aspects of the code changes in the PATCH below.
 
@@ -41,10 +51,14 @@ Detect performance bottlenecks such as:
 - non-memoized expensive function calls
 
 Input:
-File: {filename}
+File: """
+
+PROMPT_MID = """
 
 Patch:
-{patch}
+"""
+
+PROMPT_SUFFIX = """
 
 Rules:
 1. Consider ONLY the modified lines in the patch.
@@ -53,33 +67,46 @@ Rules:
 4. Reference exact line numbers when possible.
 5. If no performance issues exist, return [].
 
-Return STRICT JSON ONLY in this format:
-
-[
-  {{
-    "line": <line number or null>,
-    "severity": "<low|medium|high>",
-    "issue": "<performance bottleneck>",
-    "suggestion": "<performance improvement>",
-    "fixed_code": "<optimized code snippet or null>"
-  }}
-]
-
-Important:
-- No markdown.
-- No extra explanations.
-- Keep suggestions short and actionable."""
+Return the issues as a JSON list following the response schema.
+Keep suggestions short and actionable."""
+
+
+def _build_prompt(filename: str, patch: str) -> str:
+    return "".join((PROMPT_PREFIX, filename, PROMPT_MID, patch, PROMPT_SUFFIX))
+
+
+def analyze_file_performance(filename: str, patch: str) -> list:
+    """
+    Analyze performance aspects of a single file's code changes.
     
-    response = client.models.generate_content(
-        model="models/gemini-1.5-flash",
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            temperature=0.1,
-            response_mime_type="application/json"
-        )
-    )
+    Args:
+        filename: Name of the file being reviewed
+        patch: The diff patch content
+        
     
-    return response.text
+    Returns:
+        List of performance issues (parsed JSON)
+    """
+    return parse_result(generate_json(_client(), _build_prompt(filename, compact_patch(patch)), RESPONSE_CONFIG),
+                        RESPONSE_CONFIG)
 
 
+async def analyze_file_performance_async(filename: str, patch: str) -> list:
+    """
+    Async variant of analyze_file_performance, bounded by this agent's semaphore.
+    Large patches are reviewed in hunk-aligned chunks and the issues merged.
+    """
+    return await generate_file_async(_client(), _semaphore(), _build_prompt, filename, patch, RESPONSE_CONFIG)
+
 
+async def analyze_files_performance_async(files: list) -> dict:
+    """
+    Analyze several small files' performance with a single Gemini call.
+    
+    Args:
+        files: List of (filename, patch) tuples
+    
+    Returns:
+        Dict mapping each filename to its list of performance issues
+    """
+    return await generate_batch_async(_client(), _semaphore(), _build_prompt, files, BATCH_CONFIG, RESPONSE_CONFIG)
@@ -1,25 +1,36 @@
-from google import genai
-from google.genai import types
+from gemini_client import (get_client, get_semaphore, generate_json, generate_file_async, generate_batch_async,
+                           parse_result, json_config, batch_schema)
+from config import ensure_env
+from patch_utils import compact_patch
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY_READABILITY"))
+def _client():
+    ensure_env()
+    return get_client(os.getenv("GEMINI_API_KEY_READABILITY"))
 
 
-def analyze_file_readability(filename: str, patch: str) -> list:
-    """
-    Analyze readability and maintainability of a single file's code changes.
-    
-    Args:
-        filename: Name of the file being reviewed
-        patch: The diff patch content
-    
-    Returns:
-        List of readability issues in JSON format
-    """
-    prompt = f"""You are a Readability Review Agent for GitHub Pull Requests.
+def _semaphore():
+    ensure_env()
+    return get_semaphore(os.getenv("GEMINI_API_KEY_READABILITY"))
+
+
+ISSUE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "line": {"type": "INTEGER", "nullable": True, "description": "Line number in the patch"},
+        "severity": {"type": "STRING", "enum": ["low", "medium", "high"]},
+        "issue": {"type": "STRING", "description": "Readability problem"},
+        "suggestion": {"type": "STRING", "description": "How to improve clarity"},
+        "fixed_code": {"type": "STRING", "nullable": True, "description": "Optional improved code"}
+    },
+    "required": ["severity", "issue", "suggestion"]
+}
+
+RESPONSE_CONFIG = json_config({"type": "ARRAY", "items": ISSUE_SCHEMA})
+BATCH_CONFIG = json_config(batch_schema(ISSUE_SCHEMA))
+
+PROMPT_PREFIX = """You are a Readability Review Agent for GitHub Pull Requests.
 
 Your task is to analyze ONLY the READABILITY and MAINTAINABILITY aspects of the code changes in the PATCH below.
 
@@ -37,10 +48,14 @@ Identify issues related to:
 - too much logic inside one line
 
 Input:
-File: {filename}
+File: """
+
+PROMPT_MID = """
 
 Patch:
-{patch}
+"""
+
+PROMPT_SUFFIX = """
 
 Rules:
 1. Consider ONLY changed lines (lines starting with + or -).
@@ -49,33 +64,45 @@ Rules:
 4. Reference the corresponding line number.
 5. If no readability issues exist, return [].
 
-Return STRICT JSON ONLY, in this exact format:
-
-[
-  {{
-    "line": <line number or null>,
-    "severity": "<low|medium|high>",
-    "issue": "<readability problem>",
-    "suggestion": "<how to improve clarity>",
-    "fixed_code": "<optional improved code or null>"
-  }}
-]
-
-Important:
-- Do NOT include markdown.
-- Do NOT give explanations outside JSON.
-- Keep issue and suggestion short, clear, and actionable."""
+Return the issues as a JSON list following the response schema.
+Keep issue and suggestion short, clear, and actionable."""
+
+
+def _build_prompt(filename: str, patch: str) -> str:
+    return "".join((PROMPT_PREFIX, filename, PROMPT_MID, patch, PROMPT_SUFFIX))
+
+
+def analyze_file_readability(filename: str, patch: str) -> list:
+    """
+    Analyze readability and maintainability of a single file's code changes.
     
-    response = client.models.generate_content(
-        model="models/gemini-1.5-flash",
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            temperature=0.1,
-            response_mime_type="application/json"
-        )
-    )
+    Args:
+        filename: Name of the file being reviewed
+        patch: The diff patch content
     
-    return response.text
+    Returns:
+        List of readability issues (parsed JSON)
+    """
+    return parse_result(generate_json(_client(), _build_prompt(filename, compact_patch(patch)), RESPONSE_CONFIG),
+                        RESPONSE_CONFIG)
 
 
+async def analyze_file_readability_async(filename: str, patch: str) -> list:
+    """
+    Async variant of analyze_file_readability, bounded by this agent's semaphore.
+    Large patches are reviewed in hunk-aligned chunks and the issues merged.
+    """
+    return await generate_file_async(_client(), _semaphore(), _build_prompt, filename, patch, RESPONSE_CONFIG)
+
 
+async def analyze_files_readability_async(files: list) -> dict:
+    """
+    Analyze several small files' readability with a single Gemini call.
+    
+    Args:
+        files: List of (filename, patch) tuples
+    
+    Returns:
+        Dict mapping each filename to its list of readability issues
+    """
+    return await generate_batch_async(_client(), _semaphore(), _build_prompt, files, BATCH_CONFIG, RESPONSE_CONFIG)
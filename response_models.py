@@ -1,11 +1,12 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any
-import json
+from pydantic import BaseModel, Field, TypeAdapter, ValidationError
+from typing import List, Optional, Dict, Any, Iterable, Union
+from collections import Counter
+import orjson
 
 
 class IssueBase(BaseModel):
     line: Optional[int] = Field(None, description="Line number where the issue occurs")
-    severity: str = Field(..., description="Severity level of the issue")
+    severity: Optional[str] = Field(None, description="Severity level of the issue")
     issue: str = Field(..., description="Description of the issue")
     suggestion: str = Field(..., description="Suggested fix for the issue")
     fixed_code: Optional[str] = Field(None, description="Fixed code snippet")
@@ -14,7 +15,7 @@ class IssueBase(BaseModel):
 class FileReview(BaseModel):
     filename: str
     status: Optional[str] = None
-    issues: List[Dict[str, Any]]
+    issues: List[IssueBase]
     issue_count: int
     
     
@@ -53,19 +54,46 @@ class FullReviewResponse(BaseModel):
     recommendation: str
 
 
-def parse_json_issues(issues_str: str) -> List[Dict[str, Any]]:
+# Validates raw JSON bytes/str straight into IssueBase models in pydantic-core,
+# without an intermediate Python json -> dict pass
+_ISSUE_LIST = TypeAdapter(List[IssueBase])
+_ISSUE = TypeAdapter(IssueBase)
+
+
+def parse_json_issues(issues_str: Union[str, bytes, List[Dict[str, Any]]]) -> List[IssueBase]:
     """Parse JSON string from AI response to list of issues."""
     try:
-        if isinstance(issues_str, str):
-            return json.loads(issues_str)
-        return issues_str
-    except:
+        if isinstance(issues_str, (str, bytes)):
+            return _ISSUE_LIST.validate_json(issues_str)
+        return _ISSUE_LIST.validate_python(issues_str)
+    except ValidationError:
+        pass
+
+    # Some item is malformed (or the JSON itself is): keep whatever issues are valid
+    try:
+        items = orjson.loads(issues_str) if isinstance(issues_str, (str, bytes)) else issues_str
+    except orjson.JSONDecodeError:
         return []
+    if not isinstance(items, list):
+        return []
+
+    issues = []
+    for item in items:
+        try:
+            issues.append(_ISSUE.validate_python(item))
+        except ValidationError:
+            continue
+    return issues
 
 
-def count_severity(issues: List[Dict[str, Any]], severity: str) -> int:
+def count_severity(issues: List[IssueBase], severity: str) -> int:
     """Count issues by severity level."""
-    return sum(1 for issue in issues if issue.get('severity', '').lower() == severity.lower())
+    return sum(1 for issue in issues if (issue.severity or '').lower() == severity.lower())
+
+
+def count_severities(issues: Iterable[IssueBase]) -> Counter:
+    """Count issues for every severity level in a single scan."""
+    return Counter((issue.severity or '').lower() for issue in issues)
 
 
 def create_review_summary(files: List[FileReview]) -> ReviewSummary:
@@ -73,29 +101,37 @@ def create_review_summary(files: List[FileReview]) -> ReviewSummary:
     total_issues = sum(f.issue_count for f in files)
     files_with_issues = sum(1 for f in files if f.issue_count > 0)
     
-    all_issues = []
-    for f in files:
-        all_issues.extend(f.issues)
+    severity_counts = count_severities(issue for f in files for issue in f.issues)
     
     return ReviewSummary(
         total_files=len(files),
         files_with_issues=files_with_issues,
         total_issues=total_issues,
-        critical_issues=count_severity(all_issues, 'critical'),
-        high_issues=count_severity(all_issues, 'high'),
-        medium_issues=count_severity(all_issues, 'medium'),
-        low_issues=count_severity(all_issues, 'low')
+        critical_issues=severity_counts['critical'],
+        high_issues=severity_counts['high'],
+        medium_issues=severity_counts['medium'],
+        low_issues=severity_counts['low']
     )
 
 
-def format_single_review(pr_info: Dict, reviews: List[Dict], review_type: str) -> Dict:
-    """Format a single type of review (logic, security, readability, or performance)."""
+def build_review_section(reviews: List[Dict[str, Any]], issue_key: str) -> Dict[str, Any]:
+    """
+    Parse one review type's per-file results and summarize them in a single pass.
     
-    issue_key = f"{review_type}_issues"
-    files = []
+    Severity and issue totals are accumulated while each file's issues are
+    parsed, instead of re-walking the parsed files afterwards.
+    """
+    files: List[Dict[str, Any]] = []
+    severity_counts: Counter = Counter()
+    total_issues = 0
+    files_with_issues = 0
     
     for review in reviews:
         issues = parse_json_issues(review.get(issue_key, []))
+        severity_counts.update((issue.severity or '').lower() for issue in issues)
+        if issues:
+            files_with_issues += 1
+        total_issues += len(issues)
         files.append({
             "filename": review['filename'],
             "status": review.get('status'),
@@ -103,100 +139,48 @@ def format_single_review(pr_info: Dict, reviews: List[Dict], review_type: str) -
             "issue_count": len(issues)
         })
     
-    # Calculate summary
-    total_issues = sum(f["issue_count"] for f in files)
-    files_with_issues = sum(1 for f in files if f["issue_count"] > 0)
-    
-    all_issues = []
-    for f in files:
-        all_issues.extend(f["issues"])
-    
-    summary = {
-        "total_files": len(files),
-        "files_with_issues": files_with_issues,
-        "total_issues": total_issues,
-        "critical_issues": count_severity(all_issues, 'critical'),
-        "high_issues": count_severity(all_issues, 'high'),
-        "medium_issues": count_severity(all_issues, 'medium'),
-        "low_issues": count_severity(all_issues, 'low')
+    return {
+        "summary": {
+            "total_files": len(files),
+            "files_with_issues": files_with_issues,
+            "total_issues": total_issues,
+            "critical_issues": severity_counts['critical'],
+            "high_issues": severity_counts['high'],
+            "medium_issues": severity_counts['medium'],
+            "low_issues": severity_counts['low']
+        },
+        "files": files
     }
+
+
+def format_single_review(pr_info: Dict[str, Any], reviews: List[Dict[str, Any]], review_type: str) -> Dict[str, Any]:
+    """Format a single type of review (logic, security, readability, or performance)."""
+    
+    section = build_review_section(reviews, f"{review_type}_issues")
     
     return {
         "success": True,
         "pr_info": pr_info,
         "review_type": review_type,
-        "summary": summary,
-        "files": files
+        "summary": section["summary"],
+        "files": section["files"]
     }
 
 
-def format_full_review(pr_info: Dict, logic_reviews: List, security_reviews: List, 
-                       readability_reviews: List, performance_reviews: List) -> Dict:
+def format_full_review(pr_info: Dict[str, Any], logic_reviews: List[Dict[str, Any]],
+                       security_reviews: List[Dict[str, Any]], readability_reviews: List[Dict[str, Any]],
+                       performance_reviews: List[Dict[str, Any]]) -> Dict[str, Any]:
     """Format complete review with all review types."""
     
-    # Parse all reviews
-    logic_files = []
-    security_files = []
-    readability_files = []
-    performance_files = []
+    logic_review = build_review_section(logic_reviews, 'logic_issues')
+    security_review = build_review_section(security_reviews, 'security_issues')
+    readability_review = build_review_section(readability_reviews, 'readability_issues')
+    performance_review = build_review_section(performance_reviews, 'performance_issues')
     
-    for review in logic_reviews:
-        issues = parse_json_issues(review.get('logic_issues', []))
-        logic_files.append({
-            "filename": review['filename'],
-            "status": review.get('status'),
-            "issues": issues,
-            "issue_count": len(issues)
-        })
-    
-    for review in security_reviews:
-        issues = parse_json_issues(review.get('security_issues', []))
-        security_files.append({
-            "filename": review['filename'],
-            "status": review.get('status'),
-            "issues": issues,
-            "issue_count": len(issues)
-        })
-    
-    for review in readability_reviews:
-        issues = parse_json_issues(review.get('readability_issues', []))
-        readability_files.append({
-            "filename": review['filename'],
-            "status": review.get('status'),
-            "issues": issues,
-            "issue_count": len(issues)
-        })
-    
-    for review in performance_reviews:
-        issues = parse_json_issues(review.get('performance_issues', []))
-        performance_files.append({
-            "filename": review['filename'],
-            "status": review.get('status'),
-            "issues": issues,
-            "issue_count": len(issues)
-        })
-    
-    # Create summaries
-    def create_summary(files):
-        total_issues = sum(f["issue_count"] for f in files)
-        files_with_issues = sum(1 for f in files if f["issue_count"] > 0)
-        all_issues = []
-        for f in files:
-            all_issues.extend(f["issues"])
-        return {
-            "total_files": len(files),
-            "files_with_issues": files_with_issues,
-            "total_issues": total_issues,
-            "critical_issues": count_severity(all_issues, 'critical'),
-            "high_issues": count_severity(all_issues, 'high'),
-            "medium_issues": count_severity(all_issues, 'medium'),
-            "low_issues": count_severity(all_issues, 'low')
-        }
-    
-    logic_summary = create_summary(logic_files)
-    security_summary = create_summary(security_files)
-    readability_summary = create_summary(readability_files)
-    performance_summary = create_summary(performance_files)
+    logic_summary = logic_review["summary"]
+    security_summary = security_review["summary"]
+    readability_summary = readability_review["summary"]
+    performance_summary = performance_review["summary"]
     
     # Overall summary
     total_issues = (logic_summary["total_issues"] + security_summary["total_issues"] + 
@@ -235,21 +219,9 @@ def format_full_review(pr_info: Dict, logic_reviews: List, security_reviews: Lis
         "success": True,
         "pr_info": pr_info,
         "overall_summary": overall_summary,
-        "logic_review": {
-            "summary": logic_summary,
-            "files": logic_files
-        },
-        "security_review": {
-            "summary": security_summary,
-            "files": security_files
-        },
-        "readability_review": {
-            "summary": readability_summary,
-            "files": readability_files
-        },
-        "performance_review": {
-            "summary": performance_summary,
-            "files": performance_files
-        },
+        "logic_review": logic_review,
+        "security_review": security_review,
+        "readability_review": readability_review,
+        "performance_review": performance_review,
         "recommendation": recommendation
     }
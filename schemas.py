@@ -1,10 +1,53 @@
-from pydantic import BaseModel, Field, field_validator
+from pydantic import BaseModel, Field, PrivateAttr, field_validator, model_validator
 from urllib.parse import urlparse
+from dataclasses import dataclass
 import re
 
+# GitHub owner/repo naming rules; \Z (not $) so a trailing newline is rejected
+_GH_NAME_RE = re.compile(r'^[a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?\Z')
+
+# The canonical PR link shape in one match: https://github.com/owner/repo/pull/123,
+# optionally followed by a sub-page, query or fragment. Links that miss it fall
+# back to the step-by-step checks below, which produce the specific error.
+_PR_URL_RE = re.compile(
+    r'https://(?:www\.)?github\.com/'
+    r'([a-zA-Z0-9](?:[a-zA-Z0-9-]*[a-zA-Z0-9])?)/'
+    r'([a-zA-Z0-9](?:[a-zA-Z0-9-]*[a-zA-Z0-9])?)/'
+    r'pull/([1-9][0-9]*)(?:[/?#].*)?\Z'
+)
+
+# Cheap guards run before any parsing: a PR link can be no shorter than
+# https://github.com/a/b/pull/1, and very long input is refused outright so the
+# regex and urlparse never run on it.
+_GITHUB_PREFIXES = ("https://github.com/", "https://www.github.com/")
+_MIN_URL_LENGTH = len("https://github.com/a/b/pull/1")
+_MAX_URL_LENGTH = 2048
+
+# Leading whitespace and C0 control characters, which urlparse strips too
+_URL_LEADING_JUNK = "".join(map(chr, range(0x21)))
+
+@dataclass(slots=True, frozen=True)
+class PRRef:
+    """Owner, repo and number of a pull request, as used by the internal code paths."""
+    owner: str
+    repo: str
+    pr_number: int
+
+
+def parse_pr_url(url: str) -> PRRef:
+    """Extract the PR reference from an already-validated GitHub PR URL."""
+    match = _PR_URL_RE.match(url)
+    if match:
+        return PRRef(match[1], match[2], int(match[3]))
+    path_parts = urlparse(url).path.strip('/').split('/')
+    return PRRef(path_parts[0], path_parts[1], int(path_parts[3]))
+
+
 class InputLink(BaseModel):
     url: str = Field(..., description="The URL of the GitHub PR")
     description: str = Field(None, description="A brief description of the link")
+    _pr_ref: PRRef = PrivateAttr(default=None)
+    _pr_details: dict = PrivateAttr(default=None)
     
     @field_validator('url')
     @classmethod
@@ -20,6 +63,25 @@ class InputLink(BaseModel):
         if not v:
             raise ValueError("URL cannot be empty")
         
+        if len(v) > _MAX_URL_LENGTH:
+            raise ValueError("URL is too long")
+        
+        # Stored stripped, so later parsing sees the same link the checks did
+        v = v.lstrip(_URL_LEADING_JUNK)
+        if not v:
+            raise ValueError("URL cannot be empty")
+        
+        if not v[:len(_GITHUB_PREFIXES[1])].lower().startswith(_GITHUB_PREFIXES):
+            if not v[:8].lower().startswith("https://"):
+                raise ValueError("Only HTTPS GitHub URLs are allowed")
+            raise ValueError("URL must be from github.com domain")
+        
+        if len(v) < _MIN_URL_LENGTH:
+            raise ValueError("URL must be a GitHub Pull Request link (e.g., https://github.com/owner/repo/pull/123)")
+        
+        if _PR_URL_RE.match(v):
+            return v
+        
         # Parse the URL
         try:
             parsed = urlparse(v)
@@ -49,12 +111,10 @@ class InputLink(BaseModel):
         
         # Validate owner and repo names (GitHub naming rules)
         owner, repo = path_parts[0], path_parts[1]
-        github_name_pattern = r'^[a-zA-Z0-9]([a-zA-Z0-9-]*[a-zA-Z0-9])?$'
-        
-        if not re.match(github_name_pattern, owner):
+        if not _GH_NAME_RE.match(owner):
             raise ValueError("Invalid GitHub owner name")
         
-        if not re.match(github_name_pattern, repo):
+        if not _GH_NAME_RE.match(repo):
             raise ValueError("Invalid GitHub repository name")
         
         # Validate it's specifically a pull request
@@ -71,14 +131,23 @@ class InputLink(BaseModel):
         
         return v
     
-    def get_pr_details(self) -> dict:
-        """Extract owner, repo, and PR number from the validated GitHub PR URL."""
-        parsed = urlparse(self.url)
-        path_parts = parsed.path.strip('/').split('/')
-        
-        return {
-            "owner": path_parts[0],
-            "repo": path_parts[1],
+    @model_validator(mode='after')
+    def parse_pr_ref(self) -> 'InputLink':
+        """Extract owner, repo, and PR number once, right after the URL is validated."""
+        self._pr_ref = parse_pr_url(self.url)
+        self._pr_details = {
+            "owner": self._pr_ref.owner,
+            "repo": self._pr_ref.repo,
             "pull_request": "pull",
-            "pr_number": int(path_parts[3])
-        }
\ No newline at end of file
+            "pr_number": self._pr_ref.pr_number
+        }
+        return self
+    
+    @property
+    def pr_ref(self) -> PRRef:
+        """The pull request this link points to."""
+        return self._pr_ref
+    
+    def get_pr_details(self) -> dict:
+        """Return the owner, repo, and PR number extracted from the validated GitHub PR URL."""
+        return self._pr_details
\ No newline at end of file
@@ -1,259 +1,165 @@
-from google import genai
-from google.genai import types
+from gemini_client import (get_client, get_semaphore, generate_json, generate_file_async, generate_batch_async,
+                           parse_result, json_config)
+from config import ensure_env
+from patch_utils import compact_patch, pack_patches
+import asyncio
 import os
-from dotenv import load_dotenv
 
-load_dotenv()
 
-client = genai.Client(api_key=os.getenv("GEMINI_API_KEY"))
+def _client():
+    ensure_env()
+    return get_client(os.getenv("GEMINI_API_KEY"))
 
 
-def analyze_pr_full(all_patches: str) -> str:
+def _semaphore():
+    ensure_env()
+    return get_semaphore(os.getenv("GEMINI_API_KEY"))
+
+
+_ISSUE_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        "line": {"type": "INTEGER", "nullable": True},
+        "severity": {"type": "STRING", "enum": ["critical", "high", "medium", "low"]},
+        "issue": {"type": "STRING"},
+        "suggestion": {"type": "STRING"},
+        "fixed_code": {"type": "STRING", "nullable": True}
+    },
+    "required": ["severity", "issue", "suggestion"]
+}
+
+FILE_REVIEW_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        category: {"type": "ARRAY", "items": _ISSUE_SCHEMA}
+        for category in ("logic", "security", "readability", "performance")
+    },
+    "required": ["logic", "security", "readability", "performance"]
+}
+
+FILE_REVIEW_CONFIG = json_config(FILE_REVIEW_SCHEMA)
+
+FILE_PROMPT_PREFIX = """You are a PR review agent analyzing a single file's changes across four dimensions at once.
+
+Input:
+File: """
+
+FILE_PROMPT_MID = """
+
+Patch:
+"""
+
+FILE_PROMPT_SUFFIX = """
+
+For the changed lines, report issues in four separate lists:
+- logic: logic bugs, incorrect conditions, wrong return values, unintended behavior
+- security: injection, missing validation, hardcoded secrets, insecure APIs, data exposure, path traversal
+- readability: unclear naming, complex or nested code, magic numbers, duplication, missing comments
+- performance: unnecessary loops, redundant computation, blocking or synchronous I/O, inefficient data structures
+
+Rules:
+1. Consider ONLY the changed lines (lines starting with + or -).
+2. Put each issue in the single list it belongs to.
+3. Use "critical" severity only for security issues.
+4. Reference the exact line numbers when possible, otherwise null.
+5. Use an empty list for any dimension without issues.
+6. Keep issue and suggestion short and actionable."""
+
+
+# The comprehensive review runs the per-file prompt once per file and also asks
+# for a one-line summary and a risk score, which are combined into the PR-level
+# pr_summary and risk_score.
+PR_FILE_REVIEW_SCHEMA = {
+    "type": "OBJECT",
+    "properties": {
+        **FILE_REVIEW_SCHEMA["properties"],
+        "summary": {"type": "STRING"},
+        "risk_score": {"type": "INTEGER"}
+    },
+    "required": FILE_REVIEW_SCHEMA["required"] + ["summary", "risk_score"]
+}
+
+PR_FILE_REVIEW_CONFIG = json_config(PR_FILE_REVIEW_SCHEMA)
+
+PR_BATCH_REVIEW_CONFIG = json_config({
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"filename": {"type": "STRING"}, **PR_FILE_REVIEW_SCHEMA["properties"]},
+        "required": ["filename"] + PR_FILE_REVIEW_SCHEMA["required"]
+    }
+})
+
+PR_FILE_PROMPT_SUFFIX = FILE_PROMPT_SUFFIX + """
+7. Also return "summary": one sentence on what this file's change does, naming the file.
+8. Also return "risk_score": 0-10, how risky merging this file's change is."""
+
+
+def _build_file_prompt(filename: str, patch: str) -> str:
+    return "".join((FILE_PROMPT_PREFIX, filename, FILE_PROMPT_MID, patch, FILE_PROMPT_SUFFIX))
+
+
+def analyze_file_all(filename: str, patch: str) -> dict:
     """
-    Analyze complete PR with all file patches using a single comprehensive prompt.
-    Performs multi-dimensional analysis: logic, security, readability, and performance.
+    Analyze a single file's code changes for logic, security, readability and
+    performance issues with one Gemini call instead of four.
     
     Args:
-        all_patches: Combined string of all file patches with filenames
+        filename: Name of the file being reviewed
+        patch: The diff patch content
     
     Returns:
-        Complete PR review in JSON format with detailed categorized analysis
+        Dict with "logic", "security", "readability" and "performance" issue lists
     """
-    prompt = f"""You are a single autonomous PR review agent responsible for analyzing a pull request across multiple dimensions.
-
-Perform a complete multi-category analysis of the given PR including:
-1. **PR Summary**
-2. **Risk Scoring** (0–10)
-3. **Logic Review**
-4. **Security Review**
-5. **Readability Review**
-6. **Performance Review**
-7. **Overall Summary and Recommendation**
-
-==========================
-ANALYSIS REQUIREMENTS
-==========================
-
-For each file in the PR, analyze ONLY the changed lines in the PATCH and categorize issues into:
-
-**LOGIC REVIEW:**
-- Algorithmic errors or incorrect logic
-- Edge case handling issues
-- Control flow problems
-- Incorrect conditions or loops
-- Missing validations
-- Type mismatches
-- Undefined behavior
-
-**SECURITY REVIEW:**
-- Authentication/authorization issues
-- Input validation vulnerabilities
-- SQL injection risks
-- XSS vulnerabilities
-- Sensitive data exposure
-- Insecure cryptography
-- Path traversal risks
-- API security issues
-- Token/credential exposure
-
-**READABILITY REVIEW:**
-- Poor naming conventions
-- Missing documentation
-- Complex nested structures
-- Unclear variable names
-- Missing comments for complex logic
-- Code duplication
-- Inconsistent formatting
-- Magic numbers/strings
-
-**PERFORMANCE REVIEW:**
-- Inefficient algorithms (O(n²) where O(n) possible)
-- Unnecessary loops or iterations
-- Memory leaks or excessive allocations
-- Missing indexes or caching
-- Blocking operations
-- Inefficient data structures
-- Redundant computations
-
-==========================
-SEVERITY LEVELS
-==========================
-
-- **critical**: Security vulnerabilities, data loss risks, breaking bugs
-- **high**: Major logic errors, performance bottlenecks, significant issues
-- **medium**: Code quality issues, minor bugs, moderate improvements
-- **low**: Style issues, suggestions, minor optimizations
-
-==========================
-REQUIRED JSON OUTPUT FORMAT
-==========================
-
-Return ONLY valid JSON in this EXACT structure:
-
-{{
-  "pr_summary": "<2-3 sentence summary of what this PR changes>",
-  "risk_score": <number 0-10>,
-  "logic_review": {{
-    "summary": {{
-      "total_files": <int>,
-      "files_with_issues": <int>,
-      "total_issues": <int>,
-      "critical_issues": <int>,
-      "high_issues": <int>,
-      "medium_issues": <int>,
-      "low_issues": <int>
-    }},
-    "files": [
-      {{
-        "filename": "<string>",
-        "status": "<added|modified|deleted|renamed>",
-        "issues": [
-          {{
-            "line": <line number or null>,
-            "severity": "<critical|high|medium|low>",
-            "issue": "<clear issue description>",
-            "suggestion": "<actionable fix suggestion>",
-            "fixed_code": "<corrected code or null>"
-          }}
-        ],
-        "issue_count": <int>
-      }}
-    ]
-  }},
-  "security_review": {{
-    "summary": {{
-      "total_files": <int>,
-      "files_with_issues": <int>,
-      "total_issues": <int>,
-      "critical_issues": <int>,
-      "high_issues": <int>,
-      "medium_issues": <int>,
-      "low_issues": <int>
-    }},
-    "files": [
-      {{
-        "filename": "<string>",
-        "status": "<added|modified|deleted|renamed>",
-        "issues": [
-          {{
-            "line": <line number or null>,
-            "severity": "<critical|high|medium|low>",
-            "issue": "<clear issue description>",
-            "suggestion": "<actionable fix suggestion>",
-            "fixed_code": "<corrected code or null>"
-          }}
-        ],
-        "issue_count": <int>
-      }}
-    ]
-  }},
-  "readability_review": {{
-    "summary": {{
-      "total_files": <int>,
-      "files_with_issues": <int>,
-      "total_issues": <int>,
-      "critical_issues": <int>,
-      "high_issues": <int>,
-      "medium_issues": <int>,
-      "low_issues": <int>
-    }},
-    "files": [
-      {{
-        "filename": "<string>",
-        "status": "<added|modified|deleted|renamed>",
-        "issues": [
-          {{
-            "line": <line number or null>,
-            "severity": "<critical|high|medium|low>",
-            "issue": "<clear issue description>",
-            "suggestion": "<actionable fix suggestion>",
-            "fixed_code": "<corrected code or null>"
-          }}
-        ],
-        "issue_count": <int>
-      }}
-    ]
-  }},
-  "performance_review": {{
-    "summary": {{
-      "total_files": <int>,
-      "files_with_issues": <int>,
-      "total_issues": <int>,
-      "critical_issues": <int>,
-      "high_issues": <int>,
-      "medium_issues": <int>,
-      "low_issues": <int>
-    }},
-    "files": [
-      {{
-        "filename": "<string>",
-        "status": "<added|modified|deleted|renamed>",
-        "issues": [
-          {{
-            "line": <line number or null>,
-            "severity": "<critical|high|medium|low>",
-            "issue": "<clear issue description>",
-            "suggestion": "<actionable fix suggestion>",
-            "fixed_code": "<corrected code or null>"
-          }}
-        ],
-        "issue_count": <int>
-      }}
-    ]
-  }},
-  "overall_summary": {{
-    "total_files_reviewed": <int>,
-    "total_issues_found": <int>,
-    "breakdown": {{
-      "logic_issues": <int>,
-      "security_issues": <int>,
-      "readability_issues": <int>,
-      "performance_issues": <int>
-    }},
-    "severity_breakdown": {{
-      "critical": <int>,
-      "high": <int>,
-      "medium": <int>,
-      "low": <int>
-    }}
-  }},
-  "recommendation": "<✅ APPROVED: No issues found. This PR looks good! | ✓ ACCEPTABLE: Minor issues found. Review and address if needed. | ⚠️ CAUTION: Multiple issues found. Consider addressing them before merging. | ⚠️ WARNING: This PR has high-severity issues. Review and fix before merging. | ❌ CRITICAL: This PR has critical security issues. DO NOT MERGE until resolved.>"
-}}
-
-==========================
-CRITICAL RULES
-==========================
-
-1. ONLY analyze changed lines in the patches (lines starting with + or -)
-2. Each file must appear in ALL four review categories (logic, security, readability, performance)
-3. If a file has no issues in a category, set "issues": [] and "issue_count": 0
-4. DO NOT include markdown code blocks or explanations outside JSON
-5. Keep descriptions concise and actionable
-6. Calculate all summary counts accurately
-7. Ensure recommendation matches severity breakdown:
-   - critical > 0 → ❌ CRITICAL
-   - high > 0 → ⚠️ WARNING
-   - total > 10 → ⚠️ CAUTION
-   - total > 0 → ✓ ACCEPTABLE
-   - total = 0 → ✅ APPROVED
-
-==========================
-PR FILE PATCHES START HERE
-==========================
-
-{all_patches}
-"""
-    
-    response = client.models.generate_content(
-        model="models/gemini-1.5-flash",
-        contents=[prompt],
-        config=types.GenerateContentConfig(
-            temperature=0.1,
-            response_mime_type="application/json"
-        )
-    )
-    
-    return response.text
+    return parse_result(generate_json(_client(), _build_file_prompt(filename, compact_patch(patch)), FILE_REVIEW_CONFIG),
+                        FILE_REVIEW_CONFIG)
+
 
+async def analyze_file_all_async(filename: str, patch: str) -> dict:
+    """
+    Async variant of analyze_file_all, bounded by this agent's semaphore.
+    Large patches are reviewed in hunk-aligned chunks and the issues merged.
+    """
+    return await generate_file_async(_client(), _semaphore(), _build_file_prompt, filename, patch, FILE_REVIEW_CONFIG)
+
+
+def _build_pr_file_prompt(filename: str, patch: str) -> str:
+    return "".join((FILE_PROMPT_PREFIX, filename, FILE_PROMPT_MID, patch, PR_FILE_PROMPT_SUFFIX))
 
 
+def _batch_budget() -> int:
+    """Patch characters per comprehensive-review request: GEMINI_BATCH_TOKENS at ~4 chars per token."""
+    ensure_env()
+    return int(os.getenv("GEMINI_BATCH_TOKENS", "3000")) * 4
+
+
+async def analyze_pr_full(diffs: list) -> list:
+    """
+    Analyze a complete PR across logic, security, readability and performance.
+    
+    Small files are packed into shared requests of about GEMINI_BATCH_TOKENS
+    input tokens and larger ones get a request of their own; all requests are
+    in flight at once under this agent's semaphore, so wall time follows the
+    slowest request rather than one prompt holding the whole PR. Aggregation
+    happens locally afterwards.
+    
+    Args:
+        diffs: List of patch_utils.Patch for the files to review
+    
+    Returns:
+        One dict per file, in input order, with the four issue lists plus
+        "summary" and "risk_score"
+    """
+    async def review_batch(batch):
+        if len(batch) == 1:
+            return {batch[0].filename: await generate_file_async(
+                _client(), _semaphore(), _build_pr_file_prompt, batch[0].filename, batch[0].patch, PR_FILE_REVIEW_CONFIG
+            )}
+        return await generate_batch_async(_client(), _semaphore(), _build_pr_file_prompt,
+                                          [(diff.filename, diff.patch) for diff in batch],
+                                          PR_BATCH_REVIEW_CONFIG, PR_FILE_REVIEW_CONFIG, field=None)
+    
+    file_reviews = {}
+    for batch_result in await asyncio.gather(*(review_batch(batch) for batch in pack_patches(diffs, _batch_budget()))):
+        file_reviews.update(batch_result)
+    return [file_reviews[diff.filename] for diff in diffs]
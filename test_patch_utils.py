@@ -0,0 +1,25 @@
+from patch_utils import compact_patch, split_patch
+
+
+def test_compact_patch_keeps_form_feed_inside_line():
+    patch = "@@ -1,5 +1,5 @@\n a\n b\x0cx\n c\n-d\n+D\n e"
+    assert compact_patch(patch) == "@@ -3,3 +3,3 @@\n c\n-d\n+D\n e"
+
+
+def test_compact_patch_preserves_crlf_lines():
+    patch = "@@ -1,5 +1,5 @@\n a\r\n b\r\n c\r\n-d\r\n+D\r\n e\r"
+    assert compact_patch(patch) == "@@ -3,3 +3,3 @@\n c\r\n-d\r\n+D\r\n e\r"
+
+
+def test_compact_patch_keeps_trailing_newline():
+    patch = "@@ -1,5 +1,5 @@\n a\n b\n c\n-d\n+D\n e\n"
+    assert compact_patch(patch) == "@@ -3,3 +3,3 @@\n c\n-d\n+D\n e\n"
+
+
+def test_split_patch_cuts_oversized_hunk_on_line_boundaries():
+    patch = "@@ -0,0 +1,3 @@\n+aaaa\n+bbbb\n+cccc"
+    assert split_patch(patch, max_chars=30) == [
+        "@@ -0,0 +1 @@\n+aaaa\n",
+        "@@ -0,0 +2 @@\n+bbbb\n",
+        "@@ -0,0 +3 @@\n+cccc",
+    ]